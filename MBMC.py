@@ -1,9 +1,11 @@
 import time
 import numpy as np
 from vis_gym import *
+import guard_analytics
 
 # Configuration
 gui_flag = False  # Set to True to enable the game state visualization
+exact_flag = False  # Set to True to compute victory probabilities from the known guard parameters instead of simulating
 setup(GUI=gui_flag)
 env = game  # Gym environment initialized within vis_gym.py
 
@@ -90,7 +92,8 @@ def estimate_victory_probability(num_episodes=1000000):
     num_of_success = np.zeros(len(env.guards))
 
     for _ in range(num_episodes):
-        obs, reward, done, info = env.reset()
+        obs, info = env.reset()
+        done = False
 
         while not done:
             guard_in_cell = obs['guard_in_cell']
@@ -119,6 +122,173 @@ def estimate_victory_probability(num_episodes=1000000):
 
     return P
 
-# Run simulation with 10,000 episodes
-probability_of_victory = estimate_victory_probability(num_episodes=10000)
-print("Victory Probabilities for Guards 1-4:", probability_of_victory)
+class TransitionCounts:
+    """
+    Sparse empirical transition model over hashed states.
+
+    Holds the visit counts N(s,a,s') and summed rewards of every observed transition in COO form:
+    one entry per distinct (s,a,s') triple, stored as a sorted array of flat keys (s*A + a)*S + s'
+    with matching count and reward-sum arrays. Batches of transitions are merged in bulk with a
+    single np.unique and np.bincount, so no per-transition Python work is done.
+
+    Parameters:
+    - num_states (int): Number of hashed states.
+    - num_actions (int): Number of actions.
+    """
+
+    def __init__(self, num_states=5*5*3*5, num_actions=6):
+        self.num_states = num_states
+        self.num_actions = num_actions
+        self.keys = np.zeros(0, dtype=np.int64)
+        self.counts = np.zeros(0, dtype=np.int64)
+        self.reward_sums = np.zeros(0)
+
+    def update(self, states, actions, rewards, next_states):
+        """
+        Adds a batch of transitions to the counts.
+
+        Parameters:
+        - states (array): Hashed states s.
+        - actions (array): Actions a.
+        - rewards (array): Rewards received.
+        - next_states (array): Hashed next states s'.
+        """
+        keys = (np.asarray(states, dtype=np.int64) * self.num_actions + np.asarray(actions)) * self.num_states \
+            + np.asarray(next_states)
+        self.keys, inverse = np.unique(np.concatenate([self.keys, keys]), return_inverse=True)
+        self.counts = np.bincount(inverse, weights=np.concatenate([self.counts, np.ones(len(keys))])).astype(np.int64)
+        self.reward_sums = np.bincount(inverse, weights=np.concatenate([self.reward_sums, rewards]))
+
+    def coo(self):
+        """
+        Decodes the stored keys.
+
+        Returns:
+        - states, actions, next_states (numpy arrays): Indices of every stored (s,a,s') entry.
+        """
+        state_action, next_states = np.divmod(self.keys, self.num_states)
+        states, actions = np.divmod(state_action, self.num_actions)
+        return states, actions, next_states
+
+    def normalized(self):
+        """
+        Exports the normalized transition model with per-entry confidence.
+
+        Returns:
+        - model (dict): Arrays aligned with the stored entries:
+            'states', 'actions', 'next_states': the (s,a,s') indices,
+            'probability': estimated P(s'|s,a),
+            'mean_reward': average reward observed on the transition,
+            'visits': number of times (s,a) was taken,
+            'stderr': standard error sqrt(p(1-p)/N(s,a)) of the probability estimate.
+        """
+        states, actions, next_states = self.coo()
+        state_action = self.keys // self.num_states
+        visits = np.bincount(state_action, weights=self.counts,
+                             minlength=self.num_states * self.num_actions)[state_action]
+        probability = self.counts / visits
+        return {
+            'states': states,
+            'actions': actions,
+            'next_states': next_states,
+            'probability': probability,
+            'mean_reward': self.reward_sums / self.counts,
+            'visits': visits.astype(np.int64),
+            'stderr': np.sqrt(probability * (1 - probability) / visits),
+        }
+
+    def to_dense(self):
+        """
+        Builds dense arrays for planning.
+
+        Returns:
+        - P (numpy array): S x A x S' transition probabilities. Rows of unvisited (s,a) pairs are zero.
+        - R (numpy array): S x A x S' mean rewards.
+        """
+        model = self.normalized()
+        P = np.zeros((self.num_states, self.num_actions, self.num_states))
+        R = np.zeros_like(P)
+        index = (model['states'], model['actions'], model['next_states'])
+        P[index] = model['probability']
+        R[index] = model['mean_reward']
+        return P, R
+
+def estimate_transition_model(num_episodes=10000, batch_size=10000):
+    """
+    Estimates the full transition model from episodes of uniformly random play.
+
+    Parameters:
+    - num_episodes (int): Number of episodes to simulate
+    - batch_size (int): Number of transitions buffered before they are merged into the counts
+
+    Returns:
+    - model (TransitionCounts): Empirical counts and rewards over all states and actions
+    """
+    np.random.seed(0)
+    model = TransitionCounts()
+    batch = {'states': [], 'actions': [], 'rewards': [], 'next_states': []}
+
+    for _ in range(num_episodes):
+        obs, info = env.reset()
+        done = False
+
+        while not done:
+            state = hash_state(obs)
+            action = np.random.randint(len(env.actions))
+            obs, reward, done, info = env.step(action)
+
+            batch['states'].append(state)
+            batch['actions'].append(action)
+            batch['rewards'].append(reward)
+            batch['next_states'].append(hash_state(obs))
+            if len(batch['states']) >= batch_size:
+                model.update(**batch)
+                batch = {key: [] for key in batch}
+
+            # Update visualization if GUI enabled
+            if gui_flag:
+                refresh(obs, reward, done, info)
+
+    if batch['states']:
+        model.update(**batch)
+    return model
+
+def victory_probability_from_model(model):
+    """
+    Recovers the probability of defeating each guard from a transition model.
+
+    A fight is won exactly when the player's health is unchanged afterwards.
+
+    Parameters:
+    - model (TransitionCounts): Estimated transition model
+
+    Returns:
+    - P (numpy array): Estimated probability of defeating guards 1-4
+    """
+    states, actions, next_states = model.coo()
+    guard = states % 5
+    fights = (actions == 4) & (guard > 0)
+    won = fights & ((states // 5) % 3 == (next_states // 5) % 3)
+
+    num_of_fights = np.bincount(guard[fights] - 1, weights=model.counts[fights], minlength=len(env.guards))
+    num_of_success = np.bincount(guard[won] - 1, weights=model.counts[won], minlength=len(env.guards))
+    return np.divide(num_of_success, num_of_fights, out=np.zeros(len(env.guards)), where=num_of_fights > 0)
+
+if __name__ == "__main__":
+    if exact_flag:
+        # Guard parameters are known, so no simulation is needed
+        probability_of_victory = guard_analytics.victory_probabilities(env)
+        print("Exact Victory Probabilities for Guards 1-4:", probability_of_victory)
+    else:
+        # Run simulation with 10,000 episodes
+        probability_of_victory = estimate_victory_probability(num_episodes=10000)
+        print("Victory Probabilities for Guards 1-4:", probability_of_victory)
+
+        model = estimate_transition_model(num_episodes=10000)
+        print("Observed (s,a,s') entries:", len(model.keys))
+        print("Victory Probabilities from the transition model:", victory_probability_from_model(model))
+
+        # Ground truth from the guard parameters
+        exact = guard_analytics.victory_probabilities(env)
+        print("Exact Victory Probabilities:", exact)
+        print("Absolute error of the sampled estimate:", np.abs(probability_of_victory - exact))
@@ -1,7 +1,12 @@
+import os
+import sys
 import time
 import pickle
+import random
+import tempfile
 import numpy as np
 from vis_gym import *
+from mdp_gym import CastleEscapeEnv
 
 gui_flag = False # Set to True to enable the game state visualization
 setup(GUI=gui_flag)
@@ -71,7 +76,67 @@ def should_update_state(state, updates_count, min_updates=2):
 
     return np.any(updates_count[state, :] >= min_updates)
 
-def Q_learning(num_episodes=100000, gamma=0.9, epsilon=1, decay_rate=0.999):
+def save_pickle(path, obj):
+	"""
+	Atomically pickle an object to disk.
+
+	The object is pickled to a temporary file in the same directory and then renamed over
+	the destination, so a crash mid-write never leaves a truncated file behind.
+
+    Parameters:
+    - path (str): Destination file.
+    - obj: Object to pickle.
+    """
+	directory = os.path.dirname(os.path.abspath(path))
+	fd, tmp_path = tempfile.mkstemp(dir=directory, prefix='.' + os.path.basename(path) + '.', suffix='.tmp')
+	try:
+		with os.fdopen(fd, 'wb') as handle:
+			pickle.dump(obj, handle, protocol=pickle.HIGHEST_PROTOCOL)
+			handle.flush()
+			os.fsync(handle.fileno())
+		os.replace(tmp_path, path)
+	except BaseException:
+		if os.path.exists(tmp_path):
+			os.remove(tmp_path)
+		raise
+
+def load_pickle(path):
+	"""
+	Load an object written by save_pickle.
+
+    Parameters:
+    - path (str): File to read.
+
+    Returns:
+    - The unpickled object.
+    """
+	with open(path, 'rb') as handle:
+		return pickle.load(handle)
+
+def save_checkpoint(path, checkpoint):
+	"""
+	Atomically write a training checkpoint to disk.
+
+    Parameters:
+    - path (str): Destination file for the checkpoint.
+    - checkpoint (dict): Training state to save.
+    """
+	save_pickle(path, checkpoint)
+
+def load_checkpoint(path):
+	"""
+	Load a training checkpoint written by save_checkpoint.
+
+    Parameters:
+    - path (str): Checkpoint file to read.
+
+    Returns:
+    - checkpoint (dict): Saved training state.
+    """
+	return load_pickle(path)
+
+def Q_learning(num_episodes=100000, gamma=0.9, epsilon=1, decay_rate=0.999,
+               checkpoint_path=None, checkpoint_every=10000, resume_from=None, callback=None, log=None):
     
 	"""
 	Run Q-learning algorithm for a specified number of episodes.
@@ -81,14 +146,56 @@ def Q_learning(num_episodes=100000, gamma=0.9, epsilon=1, decay_rate=0.999):
     - gamma (float): Discount factor.
     - epsilon (float): Exploration rate.
     - decay_rate (float): Rate at which epsilon decays. Epsilon is decayed as epsilon = epsilon * decay_rate after each episode.
+    - checkpoint_path (str): File to periodically write checkpoints to. No checkpoints are written if None.
+    - checkpoint_every (int): Number of episodes between checkpoints. Must be at least 1.
+    - resume_from (str): Checkpoint file to resume from. The Q-values, update counts, epsilon, episode
+      index and RNG states are restored, so the resumed run matches an uninterrupted one exactly.
+      Raises ValueError if the checkpoint was written with a different num_episodes, gamma or decay_rate.
+    - callback (callable): Called as callback(episode, Q_table) after every episode.
+    - log (list): If given, one list per episode is appended to it, holding a (state, action, reward, probability)
+      tuple per step. probability is the chance the epsilon-greedy selection had of picking that action,
+      epsilon / 6 + (1 - epsilon) * [action == argmax Q(state)], using the epsilon and Q-values at that step.
+      Pass it to ope.pad_episodes for off-policy evaluation.
 
     Returns:
     - Q_table (dict): Dictionary containing the Q-values for each state-action pair.
     """
+	if checkpoint_every < 1:
+		raise ValueError(f"checkpoint_every must be at least 1, got {checkpoint_every}")
+
 	Q_table = {}
 	updates_count = {}
-
-	for episode in range(num_episodes):
+	start_episode = 0
+	hyperparameters = {'num_episodes': num_episodes, 'gamma': gamma, 'decay_rate': decay_rate}
+
+	def checkpoint_state(episode):
+		return {
+			'hyperparameters': hyperparameters,
+			'Q_table': Q_table,
+			'updates_count': updates_count,
+			'epsilon': epsilon,
+			'episode': episode,
+			'np_random_state': np.random.get_state(),
+			'random_state': random.getstate(),
+		}
+
+	if resume_from is not None:
+		checkpoint = load_checkpoint(resume_from)
+		if checkpoint.get('hyperparameters') != hyperparameters:
+			raise ValueError(f"Checkpoint {resume_from} was written with {checkpoint.get('hyperparameters')}, "
+			                 f"cannot resume with {hyperparameters}")
+		Q_table = checkpoint['Q_table']
+		updates_count = checkpoint['updates_count']
+		epsilon = checkpoint['epsilon']
+		start_episode = checkpoint['episode']
+		np.random.set_state(checkpoint['np_random_state'])
+		random.setstate(checkpoint['random_state'])
+		print(f"Resumed from {resume_from} at episode {start_episode}/{num_episodes}")
+
+	for episode in range(start_episode, num_episodes):
+
+		if checkpoint_path is not None and episode > start_episode and episode % checkpoint_every == 0:
+			save_checkpoint(checkpoint_path, checkpoint_state(episode))
 		
 		if episode % 10000 == 0:
 			print(f"Episode {episode}/{num_episodes}, Q_table size: {len(Q_table)}")
@@ -96,23 +203,31 @@ def Q_learning(num_episodes=100000, gamma=0.9, epsilon=1, decay_rate=0.999):
 				print(f"Q entry: {list(Q_table.items())[0]}")
 			print(f"Epsilon: {epsilon}")
 
-		obs, reward, done, info = env.reset()
+		obs, info = env.reset()
 		state = hash(obs)
+		done = False
+		if log is not None:
+			episode_log = []
+			log.append(episode_log)
 		
 		while not done:
 			if state not in Q_table:
 				Q_table[state] = np.zeros(6) 
 
 			# Epsilon-greedy action selection
+			greedy_action = np.argmax(Q_table[state])
 			if np.random.rand() < epsilon:
 				action = np.random.randint(6)
 			else:
-				action = np.argmax(Q_table[state])
+				action = greedy_action
 
 			# Take action
 			obs, reward, done, info = env.step(action)
 			next_state = hash(obs)
 
+			if log is not None:
+				episode_log.append((state, int(action), reward, epsilon / 6 + (1 - epsilon) * (action == greedy_action)))
+
 			# Initialize next state in Q_table if not present
 			if next_state not in Q_table:
 				Q_table[next_state] = np.zeros(6)
@@ -127,15 +242,322 @@ def Q_learning(num_episodes=100000, gamma=0.9, epsilon=1, decay_rate=0.999):
 
 		epsilon = max(0.001, epsilon * decay_rate)
 
+		if callback is not None:
+			callback(episode, Q_table)
+
+	if checkpoint_path is not None:
+		save_checkpoint(checkpoint_path, checkpoint_state(num_episodes))
+
 	return Q_table
 
-decay_rate = 0.999999
+def batched_Q_learning(num_episodes=100000, num_envs=64, gamma=0.9, epsilon=1, decay_rate=0.999):
+	"""
+	Run Q-learning on a batch of environments stepped in lockstep.
+
+	Each step picks epsilon-greedy actions for all running environments with one vectorized argmax and
+	applies all the TD updates to a dense 375x6 Q array in one pass. Targets are computed from the Q-values
+	at the start of the step. When the same (s,a) pair appears several times in a batch, its updates are
+	accumulated so the result is exactly what applying them one after another with eta = 1/(1 + n) gives:
+	after k updates with targets t_1..t_k starting from n previous updates,
+	Q(s,a) = ((n + 1) * Q(s,a) + t_1 + ... + t_k) / (n + k + 1).
+
+	Epsilon is shared by all environments and decayed each time an episode finishes.
+
+    Parameters:
+    - num_episodes (int): Total number of episodes to run across all environments.
+    - num_envs (int): Number of environments stepped in parallel. Must be at least 1.
+    - gamma (float): Discount factor.
+    - epsilon (float): Exploration rate.
+    - decay_rate (float): Rate at which epsilon decays. Epsilon is decayed as epsilon = epsilon * decay_rate after each episode.
+
+    Returns:
+    - Q_table (dict): Dictionary containing the Q-values for each state-action pair.
+    """
+	if num_envs < 1:
+		raise ValueError(f"num_envs must be at least 1, got {num_envs}")
+
+	num_states = 5 * 5 * 3 * 5
+	Q = np.zeros((num_states, 6))
+	updates_count = np.zeros((num_states, 6), dtype=np.int64)
+	visited = np.zeros(num_states, dtype=bool)
+
+	envs = [CastleEscapeEnv() for _ in range(num_envs)]
+	states = np.zeros(num_envs, dtype=np.int64)
+	active = np.zeros(num_envs, dtype=bool)
+	started = min(num_envs, num_episodes)
+	for i in range(started):
+		obs, info = envs[i].reset()
+		states[i] = hash(obs)
+		active[i] = True
+	visited[states[active]] = True
+	completed = 0
+
+	while completed < num_episodes:
+		running = np.flatnonzero(active)
+		state = states[running]
+
+		# Epsilon-greedy action selection
+		action = np.argmax(Q[state], axis=1)
+		explore = np.random.rand(len(running)) < epsilon
+		action[explore] = np.random.randint(6, size=np.count_nonzero(explore))
+
+		# Take actions
+		next_state = np.empty_like(state)
+		reward = np.empty(len(running))
+		done = np.empty(len(running), dtype=bool)
+		for j, i in enumerate(running):
+			obs, reward[j], done[j], info = envs[i].step(action[j])
+			next_state[j] = hash(obs)
+		visited[next_state] = True
+
+		# Update Q-values, accumulating duplicate (s,a) pairs
+		target = reward + gamma * np.max(Q[next_state], axis=1)
+		flat = state * 6 + action
+		batch_count = np.bincount(flat, minlength=Q.size).reshape(Q.shape)
+		target_sum = np.bincount(flat, weights=target, minlength=Q.size).reshape(Q.shape)
+		touched = batch_count > 0
+		Q[touched] = ((updates_count[touched] + 1) * Q[touched] + target_sum[touched]) / (updates_count[touched] + batch_count[touched] + 1)
+		updates_count += batch_count
+
+		states[running] = next_state
+		for i in running[done]:
+			if completed % 10000 == 0:
+				print(f"Episode {completed}/{num_episodes}, Q_table size: {np.count_nonzero(visited)}")
+				print(f"Epsilon: {epsilon}")
+			completed += 1
+			epsilon = max(0.001, epsilon * decay_rate)
+			if started < num_episodes:
+				obs, info = envs[i].reset()
+				states[i] = hash(obs)
+				visited[states[i]] = True
+				started += 1
+			else:
+				active[i] = False
+
+	return {int(state): Q[state].copy() for state in np.flatnonzero(visited)}
+
+def Q_lambda(num_episodes=100000, gamma=0.9, lam=0.9, epsilon=1, decay_rate=0.999, trace_threshold=1e-4, callback=None):
+	"""
+	Run Watkins's Q(lambda) with replacing eligibility traces.
+
+	Every TD error is applied to all recently visited (s,a) pairs in proportion to their eligibility trace,
+	so a large reward such as reaching the goal propagates back along the whole path in one episode
+	instead of one step per visit. The trace of the pair just taken is replaced with 1, traces decay by
+	gamma * lam each step and are cut whenever an exploratory (non-greedy) action is taken.
+
+	Traces live in a dense 375x6 array alongside an array of the indices whose trace is nonzero.
+	Only those entries are touched each step, and traces that decay below trace_threshold are dropped,
+	so the per-step cost scales with the trace length rather than the table size.
+
+	Each pair keeps its own learning rate eta = 1/(1 + number of times it was taken). With lam = 0 this
+	reduces to the one-step update of Q_learning.
+
+    Parameters:
+    - num_episodes (int): Number of episodes to run.
+    - gamma (float): Discount factor.
+    - lam (float): Trace decay parameter.
+    - epsilon (float): Exploration rate.
+    - decay_rate (float): Rate at which epsilon decays. Epsilon is decayed as epsilon = epsilon * decay_rate after each episode.
+    - trace_threshold (float): Traces smaller than this are set to zero.
+    - callback (callable): Called as callback(episode, Q) after every episode, with Q the dense 375x6 array.
+
+    Returns:
+    - Q_table (dict): Dictionary containing the Q-values for each state-action pair.
+    """
+	num_states = 5 * 5 * 3 * 5
+	Q = np.zeros((num_states, 6))
+	updates_count = np.zeros((num_states, 6), dtype=np.int64)
+	visited = np.zeros(num_states, dtype=bool)
+	traces = np.zeros(num_states * 6)
+	Q_flat = Q.reshape(-1)
+	count_flat = updates_count.reshape(-1)
+
+	for episode in range(num_episodes):
+
+		if episode % 10000 == 0:
+			print(f"Episode {episode}/{num_episodes}, Q_table size: {np.count_nonzero(visited)}")
+			print(f"Epsilon: {epsilon}")
+
+		obs, info = env.reset()
+		state = hash(obs)
+		visited[state] = True
+		active = np.zeros(0, dtype=np.int64)
+		done = False
+
+		while not done:
+			# Epsilon-greedy action selection
+			if np.random.rand() < epsilon:
+				action = np.random.randint(6)
+			else:
+				action = np.argmax(Q[state])
+
+			# Watkins: an exploratory action ends the credit assignment of the previous greedy path
+			if Q[state, action] < np.max(Q[state]):
+				traces[active] = 0
+				active = active[:0]
+
+			obs, reward, done, info = env.step(action)
+			next_state = hash(obs)
+			visited[next_state] = True
+
+			# Replacing trace for the pair just taken
+			index = state * 6 + action
+			if traces[index] == 0:
+				active = np.append(active, index)
+			traces[index] = 1
+			count_flat[index] += 1
+
+			delta = reward + gamma * np.max(Q[next_state]) - Q_flat[index]
+			Q_flat[active] += delta * traces[active] / (1 + count_flat[active])
+
+			traces[active] *= gamma * lam
+			expired = traces[active] < trace_threshold
+			if expired.any():
+				traces[active[expired]] = 0
+				active = active[~expired]
+
+			state = next_state
+
+		traces[active] = 0
+		epsilon = max(0.001, epsilon * decay_rate)
+
+		if callback is not None:
+			callback(episode, Q)
+
+	return {int(state): Q[state].copy() for state in np.flatnonzero(visited)}
+
+def episodes_to_convergence(learner, check_every=1000, patience=5, tolerance=0.02, **kwargs):
+	"""
+	Count the episodes a learner needs before its greedy policy stops changing.
+
+	Every check_every episodes the greedy action of every state with a nonzero Q-value is recorded.
+	The learner has converged at the first check from which, for patience consecutive checks, the greedy
+	action changed in at most a tolerance fraction of the states seen at both checks.
+
+    Parameters:
+    - learner (callable): Q_learning, Q_lambda or any learner accepting a callback(episode, Q) argument,
+      where Q is either a Q-table dictionary or a dense 375x6 array.
+    - check_every (int): Number of episodes between checks.
+    - patience (int): Number of consecutive unchanged checks required.
+    - tolerance (float): Fraction of states whose greedy action may still change between checks.
+    - **kwargs: Forwarded to the learner.
+
+    Returns:
+    - converged_at (int): Episode count at convergence, or None if the learner never converged.
+    - Q_table (dict): The learned Q-table.
+    """
+	checks = []
+
+	def record(episode, Q):
+		if (episode + 1) % check_every:
+			return
+		if isinstance(Q, dict):
+			rows = {state: values for state, values in Q.items() if np.any(values)}
+		else:
+			rows = {state: Q[state] for state in np.flatnonzero(np.any(Q, axis=1))}
+		checks.append((episode + 1, {state: int(np.argmax(values)) for state, values in rows.items()}))
+
+	Q_table = learner(callback=record, **kwargs)
+
+	stable = 0
+	for (_, previous), (episode, greedy) in zip(checks, checks[1:]):
+		common = greedy.keys() & previous.keys()
+		changed = sum(greedy[state] != previous[state] for state in common)
+		if changed <= tolerance * len(common):
+			stable += 1
+			if stable == patience:
+				return episode - patience * check_every, Q_table
+		else:
+			stable = 0
+	return None, Q_table
+
+def compare_convergence(num_episodes=100000, seed=0, check_every=1000, patience=5, tolerance=0.02, lam=0.9, **kwargs):
+	"""
+	Report episodes-to-convergence and final policy quality of Q_learning against Q_lambda.
+
+	Both learners are trained from the same seed and scored with evaluate_policy.
+
+    Parameters:
+    - num_episodes (int): Episode budget for each learner.
+    - seed (int): Seed for numpy and random before training.
+    - check_every (int): Number of episodes between convergence checks.
+    - patience (int): Number of consecutive unchanged checks required.
+    - tolerance (float): Fraction of states whose greedy action may still change between checks.
+    - lam (float): Trace decay parameter for Q_lambda.
+    - **kwargs: Forwarded to both learners (gamma, epsilon, decay_rate).
+
+    Returns:
+    - report (dict): For each learner, the episodes to convergence, mean evaluation reward and success rate.
+    """
+	report = {}
+	for name, learner, extra in [('Q_learning', Q_learning, {}), ('Q_lambda', Q_lambda, {'lam': lam})]:
+		np.random.seed(seed)
+		random.seed(seed)
+		converged_at, Q_table = episodes_to_convergence(learner, check_every=check_every, patience=patience,
+		                                                tolerance=tolerance, num_episodes=num_episodes,
+		                                                **extra, **kwargs)
+		mean_reward, success_rate = evaluate_policy(Q_table)
+		report[name] = {'episodes_to_convergence': converged_at, 'mean_reward': mean_reward, 'success_rate': success_rate}
+		print(f"{name}: converged after {converged_at} episodes, mean reward {mean_reward:.1f}, success rate {success_rate:.3f}")
+	return report
+
+def evaluate_policy(Q_table, num_episodes=1000, max_steps=100, seed=0):
+	"""
+	Evaluate the greedy policy of a Q-table on freshly simulated episodes.
+
+	Both RNGs are seeded so every Q-table is scored on the same sequence of episodes. States missing
+	from the Q-table fall back to a uniformly random action. Episodes are cut off after max_steps,
+	since a greedy policy can get stuck walking into a wall.
+
+    Parameters:
+    - Q_table (dict): Dictionary containing the Q-values for each state-action pair.
+    - num_episodes (int): Number of episodes to run.
+    - max_steps (int): Maximum number of steps per episode.
+    - seed (int): Seed for numpy and random.
+
+    Returns:
+    - mean_reward (float): Average undiscounted return per episode.
+    - success_rate (float): Fraction of episodes that reached the goal.
+    """
+	np.random.seed(seed)
+	random.seed(seed)
+	total_reward = 0
+	successes = 0
+
+	for _ in range(num_episodes):
+		obs, info = env.reset()
+		done = False
+		steps = 0
+		while not done and steps < max_steps:
+			state = hash(obs)
+			if state in Q_table:
+				action = np.argmax(Q_table[state])
+			else:
+				action = np.random.randint(6)
+			obs, reward, done, info = env.step(action)
+			total_reward += reward
+			steps += 1
+		if env.is_terminal() == 'goal':
+			successes += 1
+
+	return total_reward / num_episodes, successes / num_episodes
+
+if __name__ == "__main__":
+	decay_rate = 0.999999
+
+	# Pass --resume to continue an interrupted run from its last checkpoint
+	checkpoint_file = 'Q_checkpoint.pickle'
+	resume_file = checkpoint_file if '--resume' in sys.argv and os.path.exists(checkpoint_file) else None
+
+	Q_table = Q_learning(num_episodes=100000, gamma=0.9, epsilon=1, decay_rate=decay_rate,
+	                     checkpoint_path=checkpoint_file, resume_from=resume_file) # Run Q-learning
 
-Q_table = Q_learning(num_episodes=100000, gamma=0.9, epsilon=1, decay_rate=decay_rate) # Run Q-learning
+	# Save the Q-table dict to a file
+	with open('Q_table.pickle', 'wb') as handle:
+		pickle.dump(Q_table, handle, protocol=pickle.HIGHEST_PROTOCOL)
 
-# Save the Q-table dict to a file
-with open('Q_table.pickle', 'wb') as handle:
-    pickle.dump(Q_table, handle, protocol=pickle.HIGHEST_PROTOCOL)
+	# The run finished, so its checkpoint must not be picked up by a later --resume
+	os.remove(checkpoint_file)
 
 '''
 Uncomment the code below to play an episode using the saved Q-table. Useful for debugging/visualization.
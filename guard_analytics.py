@@ -0,0 +1,215 @@
+import numpy as np
+
+'''
+
+Exact guard-encounter analytics for CastleEscapeEnv.
+
+The outcome of an encounter depends only on the guard's strength and keenness:
+
+	- FIGHT (try_fight) is won when random.random() > strength, i.e. with probability 1 - strength.
+	  Win or lose, the player is moved to a random adjacent cell; a loss costs one health level.
+	- HIDE (try_hide) succeeds with probability 1 - keenness and leaves health unchanged. Otherwise the
+	  player falls back into a fight, so HIDE is won outright with probability (1 - keenness),
+	  won by fighting with probability keenness * (1 - strength) and lost with probability keenness * strength.
+
+Every function here is vectorized across guards (in the order of env.guard_names) and health levels, which are
+indexed by their integer representation (2 = Full, 1 = Injured, 0 = Critical). Critical is absorbing, as
+the episode ends there. These closed forms are the ground truth the sampled estimates in MBMC.py converge to,
+and can replace simulation entirely when the guard parameters are known.
+
+'''
+
+ACTIONS = ['FIGHT', 'HIDE']
+
+def check_action(action):
+    """
+    Validates an encounter action.
+
+    Parameters:
+    - action (str): Action to check.
+
+    Raises ValueError if action is not one of ACTIONS.
+    """
+    if action not in ACTIONS:
+        raise ValueError(f"Unknown encounter action: {action}, expected one of {ACTIONS}")
+
+def guard_parameters(env):
+    """
+    Collects the guard parameters of an environment.
+
+    Parameters:
+    - env (CastleEscapeEnv): Environment to read the guards from.
+
+    Returns:
+    - strength (numpy array): Strength of each guard.
+    - keenness (numpy array): Keenness of each guard.
+    """
+    strength = np.array([env.guards[guard]['strength'] for guard in env.guard_names])
+    keenness = np.array([env.guards[guard]['keenness'] for guard in env.guard_names])
+    return strength, keenness
+
+def fight_outcomes(env):
+    """
+    Outcome distribution of the FIGHT action against each guard.
+
+    Parameters:
+    - env (CastleEscapeEnv): Environment to read the guards from.
+
+    Returns:
+    - outcomes (dict): 'win' and 'loss' probabilities per guard.
+    """
+    strength, _ = guard_parameters(env)
+    return {'win': 1 - strength, 'loss': strength}
+
+def hide_outcomes(env):
+    """
+    Outcome distribution of the HIDE action against each guard, including the fallback fight.
+
+    Parameters:
+    - env (CastleEscapeEnv): Environment to read the guards from.
+
+    Returns:
+    - outcomes (dict): 'hidden', 'fallback_win' and 'fallback_loss' probabilities per guard,
+      and 'win', the total probability of getting past the guard without losing health.
+    """
+    strength, keenness = guard_parameters(env)
+    return {
+        'hidden': 1 - keenness,
+        'fallback_win': keenness * (1 - strength),
+        'fallback_loss': keenness * strength,
+        'win': 1 - keenness * strength,
+    }
+
+def loss_probability(env, action='FIGHT'):
+    """
+    Probability of losing a health level in one encounter with each guard.
+
+    Parameters:
+    - env (CastleEscapeEnv): Environment to read the guards from.
+    - action (str): 'FIGHT' or 'HIDE'.
+
+    Returns:
+    - numpy array: Loss probability per guard.
+    """
+    check_action(action)
+    if action == 'FIGHT':
+        return fight_outcomes(env)['loss']
+    return hide_outcomes(env)['fallback_loss']
+
+def victory_probabilities(env):
+    """
+    Exact probability of defeating each guard with the FIGHT action, as estimated by MBMC.estimate_victory_probability.
+
+    Parameters:
+    - env (CastleEscapeEnv): Environment to read the guards from.
+
+    Returns:
+    - P (numpy array): Probability of defeating guards 1-4.
+    """
+    return fight_outcomes(env)['win']
+
+def health_transition_matrices(env, action='FIGHT'):
+    """
+    One-encounter health transition matrix for each guard.
+
+    Parameters:
+    - env (CastleEscapeEnv): Environment to read the guards from.
+    - action (str): 'FIGHT' or 'HIDE'.
+
+    Returns:
+    - T (numpy array): G x 3 x 3 array, T[g, h, h'] = probability of going from health h to h'.
+    """
+    loss = loss_probability(env, action)
+    T = np.zeros((len(loss), 3, 3))
+    T[:, 0, 0] = 1
+    for health in [1, 2]:
+        T[:, health, health] = 1 - loss
+        T[:, health, health - 1] = loss
+    return T
+
+def health_distribution(env, num_encounters, action='FIGHT'):
+    """
+    Distribution of the player's health after k encounters with the same guard, for every k up to num_encounters.
+
+    Parameters:
+    - env (CastleEscapeEnv): Environment to read the guards from.
+    - num_encounters (int): Largest number of encounters k.
+    - action (str): 'FIGHT' or 'HIDE'.
+
+    Returns:
+    - D (numpy array): G x (num_encounters + 1) x 3 x 3 array, D[g, k, h, h'] = probability of
+      having health h' after k encounters with guard g when starting from health h.
+    """
+    T = health_transition_matrices(env, action)
+    D = np.empty((T.shape[0], num_encounters + 1, 3, 3))
+    D[:, 0] = np.eye(3)
+    for k in range(1, num_encounters + 1):
+        D[:, k] = D[:, k - 1] @ T
+    return D
+
+def goal_probability(env, position):
+    """
+    Probability that the random move after an encounter lands the player on the goal.
+
+    Win, loss or successful hide, the player is moved to a uniformly random in-bounds adjacent cell.
+
+    Parameters:
+    - env (CastleEscapeEnv): Environment to read the grid from.
+    - position (tuple): Cell where the encounter takes place.
+
+    Returns:
+    - float: Fraction of the in-bounds neighbours of position that are the goal room.
+    """
+    x, y = position
+    neighbours = [
+        (i, j) for i, j in [(x - 1, y), (x + 1, y), (x, y - 1), (x, y + 1)]
+        if 0 <= i < env.grid_size and 0 <= j < env.grid_size
+    ]
+    return neighbours.count(env.goal_room) / len(neighbours)
+
+def expected_encounter_reward(env, action='FIGHT', position=None):
+    """
+    Expected immediate reward of one encounter with each guard at each health level.
+
+    Without a position, the cell the player is moved to afterwards is assumed not to be the goal: only combat
+    rewards and the defeat penalty for dropping to Critical are counted. With a position, the reward is exact for
+    an encounter in that cell. Landing on the goal adds the goal reward, and since step checks for the goal
+    before defeat, a loss at Injured health that lands on the goal is not charged the defeat penalty.
+    This only matters next to the goal, at (3,4) and (4,3).
+
+    Parameters:
+    - env (CastleEscapeEnv): Environment to read the guards from.
+    - action (str): 'FIGHT' or 'HIDE'.
+    - position (tuple): Cell where the encounter takes place, or None.
+
+    Returns:
+    - R (numpy array): G x 3 array of expected rewards indexed by guard and starting health.
+      Critical health is terminal, so its entries are 0.
+    """
+    check_action(action)
+    if action == 'FIGHT':
+        outcomes = fight_outcomes(env)
+    else:
+        outcomes = hide_outcomes(env)
+        outcomes = {'win': outcomes['fallback_win'], 'loss': outcomes['fallback_loss']}
+
+    # Every outcome moves the player, so the goal is reached with the same probability in all of them
+    p_goal = 0.0 if position is None else goal_probability(env, position)
+
+    R = np.zeros((len(outcomes['win']), 3))
+    base = outcomes['win'] * env.rewards['combat_win'] + outcomes['loss'] * env.rewards['combat_loss'] \
+        + p_goal * env.rewards['goal']
+    R[:, 2] = base
+    R[:, 1] = base + outcomes['loss'] * (1 - p_goal) * env.rewards['defeat']
+    return R
+
+if __name__ == "__main__":
+    from mdp_gym import CastleEscapeEnv
+
+    env = CastleEscapeEnv()
+    print("Fight victory probabilities for guards 1-4:", victory_probabilities(env))
+    print("Hide (including fallback fight) victory probabilities for guards 1-4:", hide_outcomes(env)['win'])
+
+    D = health_distribution(env, 3)
+    for g, guard in enumerate(env.guard_names):
+        print(f"{guard}: P(still Full after k fights) = {D[g, :, 2, 2]}, P(defeated) = {D[g, :, 2, 0]}")
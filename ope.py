@@ -0,0 +1,194 @@
+import random
+import numpy as np
+
+import MFMC
+from policy import QPolicy, NUM_STATES, NUM_ACTIONS
+
+'''
+
+Off-policy evaluation of Q-table policies from logged episodes.
+
+Logged episodes are stored as padded arrays of shape (num_episodes, horizon): 'states' (hashed states),
+'actions', 'rewards', 'behavior_probs' (the probability the behavior policy gave to the logged action)
+and 'mask' (1 for real steps, 0 for padding). There are two ways to get them:
+
+	- Existing training runs: MFMC.Q_learning(log=episodes) records every step with the probability its
+	  epsilon-greedy selection gave to the action, using the live epsilon and Q-table. pad_episodes turns
+	  those records into logs, so no extra simulation is needed.
+	- New data: collect_logged_episodes plays the fixed policy epsilon_greedy_policy(Q_table, epsilon) and
+	  records its probabilities. Unlike Q_learning, which zero-initializes unseen states and so acts
+	  greedily with action 0 there, this policy is uniform on states missing from the Q-table.
+
+A target policy is a 375x6 matrix of action probabilities per state; epsilon_greedy_policy builds one from a
+Q-table. evaluate_policies scores a whole stack of target policies against the same logs in one vectorized pass with:
+
+	- per-decision weighted importance sampling (PDWIS), where the cumulative importance ratio of step t is
+	  normalized by its mean across episodes, and
+	- weighted doubly robust estimation (DR), which additionally uses a Q-value model q_hat as a control variate.
+
+Both report the variance of the estimate, computed from the per-episode contributions.
+
+Example:
+
+	episodes = []
+	MFMC.Q_learning(num_episodes=100000, log=episodes)
+	logs = pad_episodes(episodes[-5000:])
+	policies = np.stack([epsilon_greedy_policy(Q, 0.0) for Q in candidate_Q_tables])
+	q_hat = np.stack([QPolicy(Q).Q for Q in candidate_Q_tables])
+	scores = evaluate_policies(logs, policies, q_hat=q_hat)
+
+'''
+
+def epsilon_greedy_policy(Q_table, epsilon=0.0):
+    """
+    Builds the action probabilities of an epsilon-greedy policy over a Q-table.
+
+    Parameters:
+    - Q_table (dict or QPolicy): Dictionary containing the Q-values for each state-action pair,
+      or a QPolicy already loaded from one.
+    - epsilon (float): Probability of a uniformly random action.
+
+    Returns:
+    - pi (numpy array): 375x6 action probabilities. States missing from the Q-table are uniform.
+    """
+    policy = Q_table if isinstance(Q_table, QPolicy) else QPolicy(Q_table)
+    pi = np.full((NUM_STATES, NUM_ACTIONS), epsilon / NUM_ACTIONS)
+    pi[np.arange(NUM_STATES), policy.greedy] += 1 - epsilon
+    pi[~policy.seen] = 1 / NUM_ACTIONS
+    return pi
+
+def pad_episodes(episodes):
+    """
+    Pads per-step episode records into logs arrays.
+
+    Parameters:
+    - episodes (list): One list of (state, action, reward, behavior_prob) tuples per episode,
+      such as the log recorded by MFMC.Q_learning.
+
+    Returns:
+    - logs (dict): Padded (num_episodes, horizon) arrays 'states', 'actions', 'rewards', 'behavior_probs' and 'mask'.
+
+    Raises ValueError if no episode has any steps.
+    """
+    episodes = [steps for steps in episodes if steps]
+    if not episodes:
+        raise ValueError("Cannot build logs: no episode contains any steps")
+    num_episodes = len(episodes)
+    horizon = max(len(steps) for steps in episodes)
+    logs = {
+        'states': np.zeros((num_episodes, horizon), dtype=np.int64),
+        'actions': np.zeros((num_episodes, horizon), dtype=np.int64),
+        'rewards': np.zeros((num_episodes, horizon)),
+        'behavior_probs': np.ones((num_episodes, horizon)),
+        'mask': np.zeros((num_episodes, horizon)),
+    }
+    for i, steps in enumerate(episodes):
+        length = len(steps)
+        states, actions, rewards, probs = zip(*steps)
+        logs['states'][i, :length] = states
+        logs['actions'][i, :length] = actions
+        logs['rewards'][i, :length] = rewards
+        logs['behavior_probs'][i, :length] = probs
+        logs['mask'][i, :length] = 1
+    return logs
+
+def collect_logged_episodes(Q_table, epsilon, num_episodes=1000, max_steps=200, seed=0):
+    """
+    Plays the epsilon-greedy behavior policy epsilon_greedy_policy(Q_table, epsilon) and logs every step
+    with its action probability.
+
+    Parameters:
+    - Q_table (dict or QPolicy): Q-table of the behavior policy.
+    - epsilon (float): Exploration rate of the behavior policy.
+    - num_episodes (int): Number of episodes to log.
+    - max_steps (int): Maximum number of steps per episode.
+    - seed (int): Seed for numpy and random.
+
+    Returns:
+    - logs (dict): Padded (num_episodes, horizon) arrays 'states', 'actions', 'rewards', 'behavior_probs' and 'mask'.
+    """
+    np.random.seed(seed)
+    random.seed(seed)
+    mu = epsilon_greedy_policy(Q_table, epsilon)
+    cumulative = np.cumsum(mu, axis=1)
+    env = MFMC.env
+    episodes = []
+
+    for _ in range(num_episodes):
+        obs, info = env.reset()
+        done = False
+        steps = []
+        while not done and len(steps) < max_steps:
+            state = MFMC.hash(obs)
+            action = min(int(np.searchsorted(cumulative[state], np.random.rand(), side='right')), NUM_ACTIONS - 1)
+            obs, reward, done, info = env.step(action)
+            steps.append((state, action, reward, mu[state, action]))
+        episodes.append(steps)
+
+    return pad_episodes(episodes)
+
+def evaluate_policies(logs, policies, q_hat=None, gamma=0.9):
+    """
+    Estimates the discounted return of target policies from logged episodes.
+
+    Parameters:
+    - logs (dict): Logged episodes, as returned by pad_episodes or collect_logged_episodes.
+    - policies (numpy array): Target action probabilities, 375x6 for one policy or P x 375 x 6 for P policies.
+    - q_hat (numpy array): Q-value model for doubly robust estimation, 375x6 shared by all policies or
+      P x 375 x 6 (typically each policy's own Q-table). DR is skipped if None.
+    - gamma (float): Discount factor.
+
+    Returns:
+    - scores (dict): Arrays with one entry per policy: 'wis' and 'wis_var' (PDWIS estimate and its variance),
+      and 'dr' and 'dr_var' (doubly robust estimate and its variance) when q_hat is given.
+    """
+    policies = np.asarray(policies)
+    single = policies.ndim == 2
+    if single:
+        policies = policies[np.newaxis]
+
+    states, actions, mask = logs['states'], logs['actions'], logs['mask']
+    num_episodes, horizon = states.shape
+    discount = gamma ** np.arange(horizon)
+
+    # Cumulative importance ratios, left at their last value after an episode ends
+    ratios = policies[:, states, actions] / logs['behavior_probs']
+    ratios = np.where(mask > 0, ratios, 1.0)
+    rho = np.cumprod(ratios, axis=2)
+
+    # Per-decision normalization across episodes
+    mean_rho = rho.mean(axis=1, keepdims=True)
+    weights = np.divide(rho, mean_rho, out=np.zeros_like(rho), where=mean_rho > 0)
+
+    per_episode = np.sum(discount * weights * logs['rewards'] * mask, axis=2)
+    scores = {
+        'wis': per_episode.mean(axis=1),
+        'wis_var': per_episode.var(axis=1, ddof=1) / num_episodes,
+    }
+
+    if q_hat is not None:
+        q_hat = np.broadcast_to(q_hat, policies.shape)
+        v_hat = np.sum(policies * q_hat, axis=2)
+        policy_index = np.arange(len(policies))[:, np.newaxis, np.newaxis]
+        q_taken = q_hat[policy_index, states, actions]
+        v_state = v_hat[policy_index, states]
+        previous_weights = np.concatenate([np.ones_like(weights[:, :, :1]), weights[:, :, :-1]], axis=2)
+
+        per_episode = np.sum(discount * mask * (weights * (logs['rewards'] - q_taken) + previous_weights * v_state), axis=2)
+        scores['dr'] = per_episode.mean(axis=1)
+        scores['dr_var'] = per_episode.var(axis=1, ddof=1) / num_episodes
+
+    if single:
+        scores = {name: values[0] for name, values in scores.items()}
+    return scores
+
+if __name__ == "__main__":
+    policy = QPolicy.from_pickle('Q_table.pickle')
+    logs = collect_logged_episodes(policy, epsilon=0.3, num_episodes=2000)
+
+    epsilons = [0.0, 0.1, 0.3, 0.5, 1.0]
+    policies = np.stack([epsilon_greedy_policy(policy, epsilon) for epsilon in epsilons])
+    scores = evaluate_policies(logs, policies, q_hat=policy.Q)
+    for i, epsilon in enumerate(epsilons):
+        print(f"epsilon={epsilon}: PDWIS {scores['wis'][i]:.1f} (var {scores['wis_var'][i]:.1f}), "
+              f"DR {scores['dr'][i]:.1f} (var {scores['dr_var'][i]:.1f})")
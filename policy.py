@@ -0,0 +1,304 @@
+import time
+import queue
+import pickle
+import socket
+import struct
+import threading
+import socketserver
+import numpy as np
+
+'''
+
+Serving actions from a trained Q-table.
+
+QPolicy loads a Q-table (the dictionary of per-state Q-value arrays written to Q_table.pickle by MFMC.py)
+into a contiguous 375x6 array once, and precomputes the greedy action of every state. Actions are then
+looked up either one state at a time with act(state_id) or for a whole array of states with act_batch(state_ids),
+which is a single vectorized gather. State ids are the hashed states used throughout the project
+(see hash in MFMC.py), i.e. x*(5*3*5) + y*(3*5) + h*5 + g.
+
+States that never appeared in the Q-table get default_action if one is given, otherwise a uniformly random action.
+
+PolicyServer exposes a QPolicy over a local TCP socket. Requests from concurrent clients are coalesced into one
+act_batch call. The wire format is a little-endian uint32 count followed by count int32 state ids; the reply is
+count uint8 actions. A request containing a state id outside [0, 375), or one that fails to be served,
+closes its connection without affecting other clients. PolicyClient speaks that protocol.
+
+'''
+
+NUM_STATES = 5 * 5 * 3 * 5
+NUM_ACTIONS = 6
+
+_HEADER = struct.Struct('<I')
+
+def check_state_ids(state_ids):
+    """
+    Validates hashed state ids.
+
+    Parameters:
+    - state_ids (int or array): One state id or an array of them.
+
+    Returns:
+    - np.ndarray: The ids as an integer array with at least one dimension.
+
+    Raises ValueError for non-integer ids, arrays with more than one dimension, or ids outside [0, 375).
+    """
+    state_ids = np.atleast_1d(np.asarray(state_ids))
+    if state_ids.ndim != 1:
+        raise ValueError(f"State ids must be a scalar or 1-D array, got shape {state_ids.shape}")
+    if state_ids.size == 0:
+        return state_ids.astype(np.int64)
+    if not np.issubdtype(state_ids.dtype, np.integer):
+        raise ValueError(f"State ids must be integers, got dtype {state_ids.dtype}")
+    if state_ids.min() < 0 or state_ids.max() >= NUM_STATES:
+        raise ValueError(f"State ids must be in [0, {NUM_STATES}), got range "
+                         f"[{state_ids.min()}, {state_ids.max()}]")
+    return state_ids
+
+class QPolicy:
+    """
+    Greedy or epsilon-greedy policy backed by a dense Q-value array.
+
+    Parameters:
+    - Q_table (dict): Dictionary mapping hashed states to arrays (or dictionaries) of Q-values per action.
+    - epsilon (float): Probability of taking a uniformly random action instead of the greedy one.
+    - seed (int): Seed for the exploration RNG.
+    - default_action (int): Action for states missing from the Q-table. Random if None.
+    """
+
+    def __init__(self, Q_table, epsilon=0.0, seed=None, default_action=None):
+        self.Q = np.zeros((NUM_STATES, NUM_ACTIONS))
+        self.seen = np.zeros(NUM_STATES, dtype=bool)
+        for state, values in Q_table.items():
+            if isinstance(values, dict):
+                for action, value in values.items():
+                    self.Q[state, action] = value
+            else:
+                self.Q[state] = values
+            self.seen[state] = True
+
+        self.greedy = np.argmax(self.Q, axis=1).astype(np.uint8)
+        if default_action is not None:
+            self.greedy[~self.seen] = default_action
+            self.fallback = np.zeros(NUM_STATES, dtype=bool)
+        else:
+            self.fallback = ~self.seen
+
+        self.epsilon = epsilon
+        self.rng = np.random.default_rng(seed)
+
+    @classmethod
+    def from_pickle(cls, path='Q_table.pickle', **kwargs):
+        """
+        Loads a policy from a pickled Q-table.
+
+        Parameters:
+        - path (str): Pickle file containing the Q-table dictionary.
+        - **kwargs: Forwarded to QPolicy.
+
+        Returns:
+        - QPolicy: The loaded policy.
+        """
+        with open(path, 'rb') as handle:
+            return cls(pickle.load(handle), **kwargs)
+
+    def act(self, state_id):
+        """
+        Picks the action for a single state.
+
+        Parameters:
+        - state_id (int): Hashed state.
+
+        Returns:
+        - int: Action to take.
+
+        Raises ValueError if state_id is not in [0, 375).
+        """
+        (state_id,) = check_state_ids(state_id)
+        if self.fallback[state_id] or (self.epsilon > 0 and self.rng.random() < self.epsilon):
+            return int(self.rng.integers(NUM_ACTIONS))
+        return int(self.greedy[state_id])
+
+    def act_batch(self, state_ids):
+        """
+        Picks actions for a batch of states in one vectorized call.
+
+        Parameters:
+        - state_ids (np.ndarray): Integer array of hashed states. A scalar is treated as a batch of one.
+
+        Returns:
+        - np.ndarray: uint8 array of actions, one per state.
+
+        Raises ValueError if state_ids is not 1-D or contains ids outside [0, 375).
+        """
+        state_ids = check_state_ids(state_ids)
+        actions = self.greedy[state_ids]
+        explore = self.fallback[state_ids]
+        if self.epsilon > 0:
+            explore = explore | (self.rng.random(state_ids.shape) < self.epsilon)
+        num_explore = np.count_nonzero(explore)
+        if num_explore:
+            actions[explore] = self.rng.integers(NUM_ACTIONS, size=num_explore)
+        return actions
+
+def _recv_exact(sock, size):
+    buf = bytearray(size)
+    view = memoryview(buf)
+    while size:
+        received = sock.recv_into(view, size)
+        if not received:
+            raise ConnectionError("Connection closed mid-message")
+        view = view[received:]
+        size -= received
+    return bytes(buf)
+
+class _PolicyRequestHandler(socketserver.BaseRequestHandler):
+
+    def handle(self):
+        while True:
+            try:
+                header = _recv_exact(self.request, _HEADER.size)
+            except ConnectionError:
+                return
+            (count,) = _HEADER.unpack(header)
+            try:
+                state_ids = np.frombuffer(_recv_exact(self.request, 4 * count), dtype='<i4')
+            except ConnectionError:
+                return
+            try:
+                actions = self.server.submit(state_ids)
+            except Exception:
+                return
+            self.request.sendall(actions.tobytes())
+
+class PolicyServer(socketserver.ThreadingMixIn, socketserver.TCPServer):
+    """
+    Local TCP server answering action queries from a QPolicy.
+
+    Each connection is handled on its own thread, but all lookups go through a single batching thread
+    that waits up to max_delay seconds to gather up to max_batch states from concurrent requests
+    before calling act_batch once for all of them.
+
+    Parameters:
+    - policy (QPolicy): Policy to serve.
+    - address (tuple): (host, port) to listen on. Port 0 picks a free port.
+    - max_batch (int): Maximum number of states per coalesced batch.
+    - max_delay (float): Maximum time in seconds to wait for more requests before serving a batch.
+    """
+
+    daemon_threads = True
+    allow_reuse_address = True
+
+    def __init__(self, policy, address=('127.0.0.1', 0), max_batch=65536, max_delay=0.001):
+        super().__init__(address, _PolicyRequestHandler)
+        self.policy = policy
+        self.max_batch = max_batch
+        self.max_delay = max_delay
+        self.pending = queue.Queue()
+        self.batcher = threading.Thread(target=self._batch_loop, daemon=True)
+        self.batcher.start()
+
+    def submit(self, state_ids):
+        """
+        Queues a request for the batching thread and waits for its actions.
+
+        Parameters:
+        - state_ids (np.ndarray): Hashed states of one request.
+
+        Returns:
+        - np.ndarray: uint8 array of actions.
+
+        Raises ValueError for invalid state ids before they are queued, so a bad request never fails
+        the batch it would have shared with other clients. Raises the exception of the batch if serving it failed.
+        """
+        state_ids = check_state_ids(state_ids)
+        request = {'state_ids': state_ids, 'done': threading.Event()}
+        self.pending.put(request)
+        request['done'].wait()
+        if 'error' in request:
+            raise request['error']
+        return request['actions']
+
+    def _batch_loop(self):
+        while True:
+            batch = [self.pending.get()]
+            size = len(batch[0]['state_ids'])
+            deadline = time.monotonic() + self.max_delay
+            while size < self.max_batch:
+                timeout = deadline - time.monotonic()
+                if timeout <= 0:
+                    break
+                try:
+                    request = self.pending.get(timeout=timeout)
+                except queue.Empty:
+                    break
+                batch.append(request)
+                size += len(request['state_ids'])
+
+            try:
+                actions = self.policy.act_batch(np.concatenate([request['state_ids'] for request in batch]))
+            except Exception as error:
+                # Fail this batch only; the batching thread keeps serving later requests
+                for request in batch:
+                    request['error'] = error
+                    request['done'].set()
+                continue
+
+            offset = 0
+            for request in batch:
+                count = len(request['state_ids'])
+                request['actions'] = actions[offset:offset + count]
+                offset += count
+                request['done'].set()
+
+class PolicyClient:
+    """
+    Client for a PolicyServer.
+
+    Parameters:
+    - address (tuple): (host, port) of the server.
+    """
+
+    def __init__(self, address):
+        self.sock = socket.create_connection(address)
+        self.sock.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+
+    def act_batch(self, state_ids):
+        """
+        Queries actions for a batch of states.
+
+        Parameters:
+        - state_ids (np.ndarray): Integer array of hashed states.
+
+        Returns:
+        - np.ndarray: uint8 array of actions, one per state.
+        """
+        state_ids = np.ascontiguousarray(state_ids, dtype='<i4').ravel()
+        self.sock.sendall(_HEADER.pack(len(state_ids)) + state_ids.tobytes())
+        return np.frombuffer(_recv_exact(self.sock, len(state_ids)), dtype=np.uint8)
+
+    def act(self, state_id):
+        """
+        Queries the action for a single state.
+
+        Parameters:
+        - state_id (int): Hashed state.
+
+        Returns:
+        - int: Action to take.
+        """
+        return int(self.act_batch([state_id])[0])
+
+    def close(self):
+        self.sock.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+if __name__ == "__main__":
+    server = PolicyServer(QPolicy.from_pickle('Q_table.pickle'), address=('127.0.0.1', 5100))
+    print(f"Serving Q_table.pickle on {server.server_address}")
+    server.serve_forever()
@@ -0,0 +1,159 @@
+import json
+import time
+from collections import Counter
+from mdp_gym import CastleEscapeEnv
+
+'''
+
+Step-level profiling for CastleEscapeEnv.
+
+InstrumentedCastleEscapeEnv is a drop-in subclass of CastleEscapeEnv that times every call to step, reset,
+get_observation, move_player, try_fight, try_hide and move_player_to_random_adjacent, and counts the events
+that decide which branch a step takes: slips, moves blocked by a guard, moves out of bounds, fight wins and
+losses, successful hides and failed hides that fall back into a fight.
+
+CastleEscapeEnv itself is left untouched, so an uninstrumented environment pays nothing. To profile an
+environment that already exists (for example the shared env in MFMC.py or MBMC.py), call instrument(env).
+
+Times are inclusive: try_hide includes the try_fight it falls back to, and step includes everything.
+Exclusive times per call stack are kept as well and can be exported in the collapsed-stack format read
+by flamegraph.pl and speedscope.
+
+Example:
+
+	env = instrument(MFMC.env)
+	MFMC.Q_learning(num_episodes=1000)
+	print(env.stats())
+	env.export_profile('env.folded')
+
+'''
+
+EVENTS = ['slip', 'blocked_move', 'out_of_bounds', 'fight_win', 'fight_loss', 'hide_success', 'hide_fallback_fight']
+
+class InstrumentedCastleEscapeEnv(CastleEscapeEnv):
+    """
+    CastleEscapeEnv that records per-branch call counts, timings and events.
+    """
+
+    def __init__(self):
+        self.reset_stats()
+        super(InstrumentedCastleEscapeEnv, self).__init__()
+        self.reset_stats()
+
+    def reset_stats(self):
+        """
+        Clears all recorded counts and timings.
+        """
+        self.calls = Counter()
+        self.total_ns = Counter()
+        self.self_ns = Counter()
+        self.events = Counter({event: 0 for event in EVENTS})
+        self._stack = []
+        self._child_ns = []
+
+    def _timed(self, name, method, *args):
+        self._stack.append(name)
+        self._child_ns.append(0)
+        start = time.perf_counter_ns()
+        try:
+            return method(*args)
+        finally:
+            elapsed = time.perf_counter_ns() - start
+            self.self_ns[tuple(self._stack)] += elapsed - self._child_ns.pop()
+            self._stack.pop()
+            self.calls[name] += 1
+            self.total_ns[name] += elapsed
+            if self._child_ns:
+                self._child_ns[-1] += elapsed
+
+    def reset(self):
+        return self._timed('reset', super(InstrumentedCastleEscapeEnv, self).reset)
+
+    def step(self, action):
+        return self._timed('step', super(InstrumentedCastleEscapeEnv, self).step, action)
+
+    def get_observation(self):
+        return self._timed('get_observation', super(InstrumentedCastleEscapeEnv, self).get_observation)
+
+    def move_player_to_random_adjacent(self):
+        return self._timed('move_player_to_random_adjacent',
+                           super(InstrumentedCastleEscapeEnv, self).move_player_to_random_adjacent)
+
+    def move_player(self, action):
+        x, y = self.current_state['player_position']
+        intended = {'UP': (x - 1, y), 'DOWN': (x + 1, y), 'LEFT': (x, y - 1), 'RIGHT': (x, y + 1)}.get(action)
+
+        result, reward = self._timed('move_player', super(InstrumentedCastleEscapeEnv, self).move_player, action)
+
+        if result.startswith('Guard'):
+            self.events['blocked_move'] += 1
+        elif result == 'Out of bounds!':
+            self.events['out_of_bounds'] += 1
+        elif self.current_state['player_position'] != intended:
+            self.events['slip'] += 1
+        return result, reward
+
+    def try_fight(self):
+        result, reward = self._timed('try_fight', super(InstrumentedCastleEscapeEnv, self).try_fight)
+
+        if result.endswith('won!'):
+            self.events['fight_win'] += 1
+        elif result.endswith('lost!'):
+            self.events['fight_loss'] += 1
+        return result, reward
+
+    def try_hide(self):
+        result, reward = self._timed('try_hide', super(InstrumentedCastleEscapeEnv, self).try_hide)
+
+        if result.startswith('Successfully'):
+            self.events['hide_success'] += 1
+        elif result.startswith('Fought'):
+            self.events['hide_fallback_fight'] += 1
+        return result, reward
+
+    def stats(self):
+        """
+        Summarizes the recorded counts and timings.
+
+        Returns:
+            dict: 'calls', 'total_ns' and 'mean_ns' per instrumented method,
+                  and 'events' with the count of every branch event
+        """
+        return {
+            'calls': dict(self.calls),
+            'total_ns': dict(self.total_ns),
+            'mean_ns': {name: self.total_ns[name] / self.calls[name] for name in self.calls},
+            'events': dict(self.events),
+        }
+
+    def export_profile(self, path, format='collapsed'):
+        """
+        Writes the recorded profile to a file.
+
+        Parameters:
+            path (str): Destination file
+            format (str): 'collapsed' for one "step;try_hide;try_fight <ns>" line per call stack with its
+                          exclusive time, as read by flamegraph.pl and speedscope, or 'json' for stats()
+        """
+        with open(path, 'w') as handle:
+            if format == 'collapsed':
+                for stack, ns in sorted(self.self_ns.items()):
+                    handle.write(f"{';'.join(stack)} {ns}\n")
+            elif format == 'json':
+                json.dump(self.stats(), handle, indent=2)
+            else:
+                raise ValueError(f"Unknown profile format: {format}")
+
+def instrument(env):
+    """
+    Switches an existing environment to the instrumented implementation in place.
+
+    Parameters:
+        env (CastleEscapeEnv): Environment to instrument
+
+    Returns:
+        InstrumentedCastleEscapeEnv: The same environment object, with fresh statistics
+    """
+    env.__class__ = InstrumentedCastleEscapeEnv
+    env.reset_stats()
+    return env
@@ -0,0 +1,207 @@
+import os
+import json
+import random
+import hashlib
+import itertools
+import numpy as np
+from concurrent.futures import ProcessPoolExecutor, as_completed
+
+import MFMC
+
+'''
+
+Hyperparameter sweeps for MFMC.Q_learning.
+
+A sweep is a list of configs, each a dictionary over the tunable arguments of Q_learning:
+gamma, decay_rate, epsilon (the initial exploration rate) and num_episodes (the episode budget).
+Any argument missing from a config takes its value from DEFAULT_CONFIG.
+
+Every (config, seed) pair is one trial. A trial trains a Q-table and scores its greedy policy
+with MFMC.evaluate_policy on a fixed set of evaluation episodes, so trials are directly comparable.
+Trials run on a process pool and their results are cached on disk, keyed by config, seed and
+evaluation settings, so re-running a sweep only computes the points that are new.
+
+Example:
+
+	configs = grid_search_space({'gamma': [0.9, 0.99], 'decay_rate': [0.999, 0.9999]})
+	results = sweep(configs, seeds=[0, 1])
+
+'''
+
+DEFAULT_CONFIG = {
+    'gamma': 0.9,
+    'decay_rate': 0.999999,
+    'epsilon': 1.0,
+    'num_episodes': 100000,
+}
+
+CONFIG_TYPES = {
+    'gamma': float,
+    'decay_rate': float,
+    'epsilon': float,
+    'num_episodes': int,
+}
+
+def normalize_config(config):
+    """
+    Converts config values to plain Python scalars.
+
+    NumPy scalars (e.g. from np.arange or np.linspace) are not JSON serializable, and 1 and 1.0 would
+    otherwise hash to different cache keys for the same trial.
+
+    Parameters:
+    - config (dict): Config, possibly partial.
+
+    Returns:
+    - config (dict): Config with float gamma, decay_rate and epsilon, and int num_episodes.
+    """
+    unknown = set(config) - set(CONFIG_TYPES)
+    if unknown:
+        raise ValueError(f"Unknown sweep parameters: {sorted(unknown)}")
+    return {name: CONFIG_TYPES[name](value) for name, value in config.items()}
+
+def grid_search_space(space):
+    """
+    Builds every combination of the values in a search space.
+
+    Parameters:
+    - space (dict): Maps each argument name to a list of values to try.
+
+    Returns:
+    - configs (list): One config dictionary per point of the grid.
+    """
+    names = sorted(space)
+    return [dict(zip(names, values)) for values in itertools.product(*(space[name] for name in names))]
+
+def random_search_space(space, num_samples, seed=0):
+    """
+    Samples configs at random from a search space.
+
+    Parameters:
+    - space (dict): Maps each argument name to either a list of values, sampled uniformly,
+      or a (low, high) tuple, sampled uniformly from the interval. num_episodes is rounded to an int.
+    - num_samples (int): Number of configs to draw.
+    - seed (int): Seed for the sampler.
+
+    Returns:
+    - configs (list): The sampled config dictionaries.
+    """
+    rng = np.random.RandomState(seed)
+    configs = []
+    for _ in range(num_samples):
+        config = {}
+        for name in sorted(space):
+            values = space[name]
+            if isinstance(values, tuple):
+                low, high = values
+                value = float(rng.uniform(low, high))
+                if name == 'num_episodes':
+                    value = int(round(value))
+            else:
+                value = values[rng.randint(len(values))]
+            config[name] = value
+        configs.append(config)
+    return configs
+
+def trial_key(config, seed, eval_episodes, eval_seed):
+    """
+    Computes the cache key of a trial.
+
+    Parameters:
+    - config (dict): Complete trial config.
+    - seed (int): Training seed.
+    - eval_episodes (int): Number of evaluation episodes.
+    - eval_seed (int): Evaluation seed.
+
+    Returns:
+    - str: Hex digest uniquely identifying the trial.
+    """
+    payload = json.dumps({
+        'config': config,
+        'seed': seed,
+        'eval_episodes': eval_episodes,
+        'eval_seed': eval_seed,
+    }, sort_keys=True)
+    return hashlib.sha1(payload.encode('utf-8')).hexdigest()
+
+def run_trial(config, seed, eval_episodes=1000, eval_seed=12345):
+    """
+    Trains a Q-table for one config and scores its greedy policy.
+
+    Parameters:
+    - config (dict): Complete trial config.
+    - seed (int): Seed for numpy and random during training.
+    - eval_episodes (int): Number of evaluation episodes.
+    - eval_seed (int): Seed for the evaluation episodes.
+
+    Returns:
+    - result (dict): The config, seed, mean evaluation reward and goal success rate.
+    """
+    np.random.seed(seed)
+    random.seed(seed)
+    Q_table = MFMC.Q_learning(num_episodes=config['num_episodes'], gamma=config['gamma'],
+                              epsilon=config['epsilon'], decay_rate=config['decay_rate'])
+    mean_reward, success_rate = MFMC.evaluate_policy(Q_table, num_episodes=eval_episodes, seed=eval_seed)
+    return {
+        'config': config,
+        'seed': seed,
+        'mean_reward': mean_reward,
+        'success_rate': success_rate,
+    }
+
+def sweep(configs, seeds=(0,), cache_dir='sweep_cache', max_workers=None, eval_episodes=1000, eval_seed=12345):
+    """
+    Runs every (config, seed) trial of a sweep, reusing cached results where available.
+
+    Parameters:
+    - configs (list): Config dictionaries, e.g. from grid_search_space or random_search_space.
+    - seeds (iterable): Training seeds to run for each config.
+    - cache_dir (str): Directory holding one cached result file per trial.
+    - max_workers (int): Size of the process pool. Defaults to the number of CPUs.
+    - eval_episodes (int): Number of evaluation episodes per trial.
+    - eval_seed (int): Seed for the evaluation episodes.
+
+    Returns:
+    - results (list): Result dictionaries of all trials, best mean reward first.
+    """
+    os.makedirs(cache_dir, exist_ok=True)
+    results = []
+    pending = {}
+
+    for config in configs:
+        config = {**DEFAULT_CONFIG, **normalize_config(config)}
+        for seed in map(int, seeds):
+            key = trial_key(config, seed, eval_episodes, eval_seed)
+            path = os.path.join(cache_dir, key + '.pickle')
+            if os.path.exists(path):
+                results.append(MFMC.load_pickle(path))
+            elif path not in pending:
+                pending[path] = (config, seed)
+
+    print(f"Sweep: {len(results)} cached trials, {len(pending)} to run")
+
+    if pending:
+        with ProcessPoolExecutor(max_workers=max_workers) as executor:
+            futures = {
+                executor.submit(run_trial, config, seed, eval_episodes, eval_seed): path
+                for path, (config, seed) in pending.items()
+            }
+            for future in as_completed(futures):
+                result = future.result()
+                MFMC.save_pickle(futures[future], result)
+                results.append(result)
+                print(f"Trial {result['config']} seed {result['seed']}: "
+                      f"mean reward {result['mean_reward']:.1f}, success rate {result['success_rate']:.3f}")
+
+    results.sort(key=lambda result: result['mean_reward'], reverse=True)
+    return results
+
+if __name__ == "__main__":
+    configs = grid_search_space({
+        'gamma': [0.9, 0.95, 0.99],
+        'decay_rate': [0.9999, 0.99999, 0.999999],
+    })
+    results = sweep(configs, seeds=[0, 1, 2])
+
+    for result in results[:5]:
+        print(result)
@@ -0,0 +1,260 @@
+import copy
+import math
+import random
+import pickle
+from collections import Counter
+import numpy as np
+from mdp_gym import CastleEscapeEnv
+
+'''
+
+Golden-trace equivalence harness for alternative implementations of CastleEscapeEnv.
+
+Any engine that claims to reproduce CastleEscapeEnv must expose reset(), step(action) and a current_state
+dictionary of the same shape ({'player_position', 'player_health', 'guard_positions'}). It is checked in two ways:
+
+	1. Trace replay. record_traces plays seeded episodes with random actions on the reference environment
+	   and records the full state, observation, reward and done flag after every step. replay_traces
+	   re-seeds numpy and random identically, replays the recorded actions on the candidate engine and
+	   reports the first mismatch of each episode. This requires the candidate to consume random numbers
+	   exactly like the reference.
+
+	2. Transition-frequency tests. frequency_test puts both engines into the same hand-picked states
+	   (PROBES), samples the same action many times and compares the outcome distributions with a
+	   chi-square homogeneity test. This covers the stochastic paths without assuming identical RNG use:
+	   the 10% slip that only lands on in-bounds non-intended cells, fights against each guard,
+	   and failed hides falling back into a fight.
+
+Example:
+
+	traces = record_traces(num_episodes=1000)
+	mismatches = replay_traces(traces, MyFastEnv)
+	results = frequency_test(CastleEscapeEnv, MyFastEnv)
+
+'''
+
+def snapshot(env):
+    """
+    Copies the current state of an engine.
+
+    Parameters:
+    - env: Engine exposing current_state.
+
+    Returns:
+    - dict: Plain copy of the player position, health and guard positions.
+    """
+    state = env.current_state
+    return {
+        'player_position': tuple(state['player_position']),
+        'player_health': state['player_health'],
+        'guard_positions': {guard: tuple(pos) for guard, pos in state['guard_positions'].items()},
+    }
+
+def seed_all(seed):
+    np.random.seed(seed)
+    random.seed(seed)
+
+def record_traces(num_episodes=1000, seed=0, max_steps=500, env_factory=CastleEscapeEnv):
+    """
+    Records seeded reference traces with uniformly random actions.
+
+    Parameters:
+    - num_episodes (int): Number of episodes to record.
+    - seed (int): Base seed. Episode i is seeded with seed + i.
+    - max_steps (int): Maximum number of steps per episode.
+    - env_factory (callable): Builds the reference environment.
+
+    Returns:
+    - traces (list): One dictionary per episode with its seed, initial state and list of steps.
+    """
+    env = env_factory()
+    traces = []
+    for episode in range(num_episodes):
+        episode_seed = seed + episode
+        action_rng = np.random.RandomState(episode_seed)
+        seed_all(episode_seed)
+        obs, info = env.reset()
+        trace = {'seed': episode_seed, 'observation': obs, 'initial_state': snapshot(env), 'steps': []}
+
+        done = False
+        while not done and len(trace['steps']) < max_steps:
+            action = int(action_rng.randint(len(env.actions)))
+            obs, reward, done, info = env.step(action)
+            trace['steps'].append({
+                'action': action,
+                'observation': obs,
+                'reward': reward,
+                'done': done,
+                'state': snapshot(env),
+            })
+        traces.append(trace)
+    return traces
+
+def save_traces(traces, path='golden_traces.pickle'):
+    with open(path, 'wb') as handle:
+        pickle.dump(traces, handle, protocol=pickle.HIGHEST_PROTOCOL)
+
+def load_traces(path='golden_traces.pickle'):
+    with open(path, 'rb') as handle:
+        return pickle.load(handle)
+
+def replay_traces(traces, env_factory):
+    """
+    Replays recorded traces against a candidate engine and diffs them step by step.
+
+    Parameters:
+    - traces (list): Traces from record_traces or load_traces.
+    - env_factory (callable): Builds the candidate engine.
+
+    Returns:
+    - mismatches (list): The first mismatch of every diverging episode, as dictionaries with the
+      episode seed, step index (-1 for the reset), field name, expected and actual values.
+    """
+    env = env_factory()
+    mismatches = []
+    for trace in traces:
+        seed_all(trace['seed'])
+        obs, info = env.reset()
+        expected = {'observation': trace['observation'], 'state': trace['initial_state']}
+        actual = {'observation': obs, 'state': snapshot(env)}
+        mismatch = _diff(trace['seed'], -1, expected, actual)
+
+        for index, step in enumerate(trace['steps']):
+            if mismatch:
+                break
+            obs, reward, done, info = env.step(step['action'])
+            actual = {'observation': obs, 'reward': reward, 'done': done, 'state': snapshot(env)}
+            mismatch = _diff(trace['seed'], index, step, actual)
+
+        if mismatch:
+            mismatches.append(mismatch)
+    return mismatches
+
+def _diff(seed, index, expected, actual):
+    for field in actual:
+        if expected[field] != actual[field]:
+            return {'seed': seed, 'step': index, 'field': field,
+                    'expected': expected[field], 'actual': actual[field]}
+    return None
+
+def _probe_state(position, health='Full', guard=None):
+    # Park the guards on fixed cells; the probed guard, if any, joins the player.
+    parking = {'G1': (1, 3), 'G2': (3, 1), 'G3': (2, 4), 'G4': (4, 2)}
+    guard_positions = dict(parking)
+    if guard is not None:
+        guard_positions[guard] = position
+    return {'player_position': position, 'player_health': health, 'guard_positions': guard_positions}
+
+PROBES = [
+    ('move into wall from corner', _probe_state((0, 0)), 'UP'),
+    ('move from corner, single slip target', _probe_state((0, 0)), 'DOWN'),
+    ('move along edge, two slip targets', _probe_state((0, 2)), 'DOWN'),
+    ('move from center, three slip targets', _probe_state((2, 2)), 'RIGHT'),
+    ('move into goal', _probe_state((3, 4)), 'DOWN'),
+    ('move blocked by guard', _probe_state((2, 2), guard='G1'), 'LEFT'),
+    ('fight without guard', _probe_state((2, 2)), 'FIGHT'),
+    ('hide without guard', _probe_state((2, 2)), 'HIDE'),
+] + [
+    (f'fight {guard} at {health} health', _probe_state((2, 2), health, guard), 'FIGHT')
+    for guard in ['G1', 'G2', 'G3', 'G4'] for health in ['Full', 'Injured']
+] + [
+    (f'hide from {guard} at {health} health', _probe_state((0, 0), health, guard), 'HIDE')
+    for guard in ['G1', 'G2', 'G3', 'G4'] for health in ['Full', 'Injured']
+]
+
+def transition_frequencies(env, state, action, num_samples, seed=0):
+    """
+    Samples the outcome of one action from a fixed state.
+
+    Parameters:
+    - env: Engine exposing current_state and step.
+    - state (dict): State to start every sample from.
+    - action (str or int): Action to take.
+    - num_samples (int): Number of samples.
+    - seed (int): Seed for numpy and random.
+
+    Returns:
+    - Counter: Counts of (player_position, player_health, reward, done) outcomes.
+    """
+    seed_all(seed)
+    counts = Counter()
+    for _ in range(num_samples):
+        env.current_state = copy.deepcopy(state)
+        obs, reward, done, info = env.step(action)
+        counts[(tuple(obs['player_position']), obs['player_health'], reward, done)] += 1
+    return counts
+
+def chi_square_homogeneity(expected_counts, actual_counts):
+    """
+    Chi-square test that two samples of outcomes come from the same distribution.
+
+    The p-value uses the Wilson-Hilferty normal approximation of the chi-square distribution.
+
+    Parameters:
+    - expected_counts (Counter): Outcome counts of the first sample.
+    - actual_counts (Counter): Outcome counts of the second sample.
+
+    Returns:
+    - statistic (float): Chi-square statistic.
+    - dof (int): Degrees of freedom.
+    - p_value (float): Probability of a statistic at least this large under the null hypothesis.
+    """
+    outcomes = sorted(set(expected_counts) | set(actual_counts), key=repr)
+    table = np.array([[expected_counts[o] for o in outcomes], [actual_counts[o] for o in outcomes]], dtype=float)
+    dof = len(outcomes) - 1
+    if dof == 0:
+        return 0.0, 0, 1.0
+
+    totals = table.sum(axis=1, keepdims=True)
+    expected = totals * table.sum(axis=0, keepdims=True) / table.sum()
+    statistic = float(np.sum((table - expected) ** 2 / expected))
+
+    scale = 2 / (9 * dof)
+    z = ((statistic / dof) ** (1 / 3) - (1 - scale)) / math.sqrt(scale)
+    return statistic, dof, 0.5 * math.erfc(z / math.sqrt(2))
+
+def frequency_test(reference_factory, candidate_factory, probes=PROBES, num_samples=20000, alpha=1e-3, seed=0):
+    """
+    Compares the transition frequencies of two engines on every probe.
+
+    Parameters:
+    - reference_factory (callable): Builds the reference engine.
+    - candidate_factory (callable): Builds the candidate engine.
+    - probes (list): (description, state, action) tuples to test.
+    - num_samples (int): Samples per probe and engine.
+    - alpha (float): Significance level below which a probe fails.
+    - seed (int): Base seed. The two engines use different seeds so their samples are independent.
+
+    Returns:
+    - results (list): One dictionary per probe with its description, chi-square statistic,
+      degrees of freedom, p-value, pass flag and both outcome counts.
+    """
+    reference = reference_factory()
+    candidate = candidate_factory()
+    results = []
+    for index, (description, state, action) in enumerate(probes):
+        expected_counts = transition_frequencies(reference, state, action, num_samples, seed=seed + 2 * index)
+        actual_counts = transition_frequencies(candidate, state, action, num_samples, seed=seed + 2 * index + 1)
+        statistic, dof, p_value = chi_square_homogeneity(expected_counts, actual_counts)
+        results.append({
+            'probe': description,
+            'statistic': statistic,
+            'dof': dof,
+            'p_value': p_value,
+            'passed': p_value >= alpha,
+            'expected_counts': expected_counts,
+            'actual_counts': actual_counts,
+        })
+    return results
+
+if __name__ == "__main__":
+    traces = record_traces(num_episodes=1000)
+    save_traces(traces)
+    print(f"Recorded {len(traces)} traces, {sum(len(trace['steps']) for trace in traces)} steps")
+
+    # Sanity check: the reference must agree with itself.
+    mismatches = replay_traces(load_traces(), CastleEscapeEnv)
+    print(f"Replay mismatches: {len(mismatches)}")
+    for result in frequency_test(CastleEscapeEnv, CastleEscapeEnv):
+        print(f"{'PASS' if result['passed'] else 'FAIL'} {result['probe']}: "
+              f"chi2={result['statistic']:.2f}, dof={result['dof']}, p={result['p_value']:.3g}")